@@ -1,20 +1,74 @@
 import os
 import subprocess
 from pathlib import Path
-from typing import List, Tuple, Optional
+from urllib.parse import urlparse
+from typing import Callable, Dict, Iterator, List, Tuple, Optional, Set
 from dotenv import load_dotenv
 import spotipy
+import requests_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from spotipy.oauth2 import SpotifyClientCredentials
+from spotipy.cache_handler import CacheFileHandler
 import re
+import json
+import hashlib
 import threading
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
+from collections import Counter, deque
+from functools import lru_cache
 import sys
+import shutil
 import queue
+import selectors
+import codecs
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-# Utility to sanitize filenames
+# (artist, album, track_id, url_type, track_url, title)
+TrackItem = Tuple[str,str,str,str,str,str]
+
+# Formats de progression reconnus dans la sortie de spotdl, en une seule expression
+_PROGRESS_RE = re.compile(
+    r'Downloaded\s+(?P<dl>\d+(?:\.\d+)?)%'  # Format avec "Downloaded"
+    r'|Progress:\s*(?P<pg>\d+(?:\.\d+)?)%'  # Format avec "Progress:"
+    r'|\d+/\d+\s*\((?P<rat>\d+(?:\.\d+)?)%\)'  # Format avec ratio: 45/100 (45%)
+    r'|(?P<pct>\d+(?:\.\d+)?)%'  # Format standard: 45.2%
+)
+# Mots-clés (en minuscules) indiquant l'étape en cours, trouvés en une seule passe
+_STATUS_TABLE = {
+    'downloading': '📥 Téléchargement', 'téléchargement': '📥 Téléchargement', 'download': '📥 Téléchargement',
+    'converting': '🔄 Conversion', 'conversion': '🔄 Conversion',
+    'searching': '🔍 Recherche', 'recherche': '🔍 Recherche',
+}
+_STATUS_RE = re.compile('|'.join(sorted(_STATUS_TABLE, key=len, reverse=True)), re.I)
+# Lignes de spotdl annonçant la fin d'une piste: 'Downloaded "<artistes> - <titre>"'
+# ou 'Skipping <artistes> - <titre> (file already exists)'
+_DONE_RE = re.compile(r'(?:downloaded|skipping)\s+(?:"(?P<quoted>[^"]+)"|(?P<name>.+)\s+\(file already exists)', re.I)
+
+# Version du format des pistes en cache disque (à incrémenter si TrackItem change)
+_CACHE_VERSION = 2
+
+# Caractères retirés pour la comparaison approximative des titres et noms de fichiers
+_CLEAN_RE = re.compile(r'[^\w\s-]')
+
+# Fichier, dans chaque dossier d'album, listant les IDs Spotify des pistes déjà téléchargées
+_TRACK_IDS_FILE = '.track_ids'
+
+# Nombre max d'URLs par appel spotdl (longueur de ligne de commande sous Windows)
+_SPOTDL_BATCH_SIZE = 25
+
+_SANITIZE_TABLE = str.maketrans({c: '_' for c in '<>:"/\\|?*'})
+
+# Utility to sanitize filenames (artistes et albums se répètent beaucoup d'une piste à l'autre)
+@lru_cache(maxsize=4096)
 def sanitize_filename(name: str) -> str:
-    return re.sub(r'[<>:"/\\|?*]', '_', name).strip()
+    return name.translate(_SANITIZE_TABLE).strip()
+
+@lru_cache(maxsize=256)
+def _bar(filled: int, width: int) -> str:
+    """Barre de progression, construite une seule fois par (remplissage, largeur)"""
+    return '█'*filled + '░'*(width-filled)
 
 @dataclass
 class DownloadProgress:
@@ -34,13 +88,11 @@ class DownloadProgress:
     def get_global_progress_bar(self, width: int = 40) -> str:
         pct = (self.completed_items / self.total_items * 100) if self.total_items else 0
         filled = int(width * self.completed_items / max(self.total_items,1))
-        bar = '█'*filled + '░'*(width-filled)
-        return f"[{bar}] {self.completed_items}/{self.total_items} ({pct:.1f}%)"
+        return f"[{_bar(filled, width)}] {self.completed_items}/{self.total_items} ({pct:.1f}%)"
 
     def get_track_progress_bar(self, width: int = 30) -> str:
         filled = int(width * self.current_track_progress / 100)
-        bar = '█'*filled + '░'*(width-filled)
-        return f"[{bar}] {self.current_track_progress:.1f}%"
+        return f"[{_bar(filled, width)}] {self.current_track_progress:.1f}%"
 
 class SpotifyDownloader:
     def __init__(self):
@@ -50,47 +102,103 @@ class SpotifyDownloader:
         self.music_directory.mkdir(exist_ok=True)
         self.sp = self._init_spotify_client()
         self.progress = DownloadProgress()
-        self._stop_flag = False
+        # Limité pour éviter le rate-limiting Spotify/YouTube (chaque spotdl utilise déjà 4 threads)
+        try:
+            self.max_parallel_downloads = max(1, int(os.getenv('DL_CONCURRENCY') or 2))
+        except ValueError:
+            print('⚠️ DL_CONCURRENCY invalide, valeur par défaut: 2')
+            self.max_parallel_downloads = 2
+        self._stop_event = threading.Event()
+        self._progress_thread: Optional[threading.Thread] = None
         self._lock = threading.Lock()
+        self._progress_event = threading.Event()
+        self._created_dirs: Set[Path] = set()
+        self._downloaded_ids: Dict[Path, Set[str]] = {}
+        self._ids_lock = threading.Lock()
+        self._album_listing_cache: Dict[Path, Tuple[Set[str], Set[str]]] = {}
+        self._index_existing()
+        self._last_render = None
+        # Pool partagé pour la pagination: borne globale des requêtes simultanées, threads réutilisés
+        self._page_pool = ThreadPoolExecutor(max_workers=6, thread_name_prefix='spotify-page')
+        # Cache disque des pistes d'album/playlist déjà analysées
+        self.cache_dir = self.script_directory / '.cache'
+        self.cache_dir.mkdir(exist_ok=True)
+        self._cache_locks: Dict[str, threading.Lock] = {}
 
     def _init_spotify_client(self) -> spotipy.Spotify:
         cid = os.getenv('SPOTIFY_CLIENT_ID')
         cs = os.getenv('SPOTIFY_CLIENT_SECRET')
         if not cid or not cs:
             raise ValueError('SPOTIFY_CLIENT_ID et SPOTIFY_CLIENT_SECRET requis')
-        auth = SpotifyClientCredentials(client_id=cid, client_secret=cs)
-        return spotipy.Spotify(auth_manager=auth)
+        # Le jeton est conservé sur disque et réutilisé jusqu'à expiration d'une exécution à l'autre
+        token_cache = CacheFileHandler(cache_path=str(self.script_directory / '.spotify_token_cache'))
+        auth = SpotifyClientCredentials(client_id=cid, client_secret=cs, cache_handler=token_cache)
+        # Cache HTTP sur disque: les métadonnées album/playlist changent rarement d'un jour à l'autre.
+        # Les playlists n'y passent pas: le snapshot_id doit être à jour pour détecter une modification,
+        # et leurs pages sont déjà en cache disque (.cache/) sous ce snapshot_id
+        session = requests_cache.CachedSession(
+            str(self.script_directory / '.spotify_cache'), expire_after=86400, allowable_methods=('GET',),
+            urls_expire_after={'api.spotify.com/v1/playlists/*': requests_cache.DO_NOT_CACHE})
+        # Une session fournie remplace celle de spotipy et ses retries: pool de connexions assez
+        # grand pour la pagination parallèle, et reprise sur 429/5xx en respectant Retry-After
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32,
+                              max_retries=Retry(total=5, backoff_factor=0.5,
+                                                status_forcelist=(429, 500, 502, 503, 504)))
+        session.mount('https://', adapter)
+        return spotipy.Spotify(auth_manager=auth, requests_session=session)
 
     def _display_progress(self):
-        lines = 0
-        while not self._stop_flag:
+        frame: List[str] = []
+        term_size = shutil.get_terminal_size()
+        stopping = False
+        while not stopping:
+            self._progress_event.wait(timeout=2.0)
+            self._progress_event.clear()
+            # Arrêt demandé: l'état final est tout de même dessiné avant de sortir
+            stopping = self._stop_event.is_set()
+            # Copie de l'état sous le verrou, affichage sans le verrou
             with self._lock:
-                if lines > 0:
-                    for _ in range(lines): print("\033[1A\033[K", end='')
-                lines = 0
-                print(f"🌍 Global: {self.progress.get_global_progress_bar()}")
-                lines += 1
-                if self.progress.skipped_items > 0:
-                    print(f"⏭️ Ignorés: {self.progress.skipped_items}")
-                    lines += 1
-                if self.progress.current_track:
-                    print(f"🎵 Titre:  {self.progress.get_track_progress_bar()} {self.progress.current_track}")
-                    lines += 1
-                if self.progress.current_track_status:
-                    print(f"📊 Status: {self.progress.current_track_status}")
-                    lines += 1
-                sys.stdout.flush()
-            time.sleep(0.3)
+                p = replace(self.progress)
+            state = (p.completed_items, p.total_items, p.skipped_items, p.current_track,
+                     p.current_track_progress, p.current_track_status)
+            # Rien n'a changé depuis le dernier affichage: pas de réécriture du terminal
+            if state == self._last_render:
+                continue
+            self._last_render = state
+            new_frame = [f"🌍 Global: {p.get_global_progress_bar()}"]
+            if p.skipped_items > 0:
+                new_frame.append(f"⏭️ Ignorés: {p.skipped_items}")
+            if p.current_track:
+                new_frame.append(f"🎵 Titre:  {p.get_track_progress_bar()} {p.current_track}")
+            if p.current_track_status:
+                new_frame.append(f"📊 Status: {p.current_track_status}")
+            # Toute l'image est écrite en un seul appel
+            n = len(frame)
+            size = shutil.get_terminal_size()
+            if len(new_frame) == n and size == term_size:
+                # Même disposition: ne réécrire que les lignes modifiées, puis revenir sous l'image
+                out = "".join(f"\033[{n-i}A\r\033[K{line}\033[{n-i}B\r"
+                              for i, (line, old) in enumerate(zip(new_frame, frame)) if line != old)
+            else:
+                out = (f"\033[{n}A\033[J" if n else "") + "".join(f"{line}\n" for line in new_frame)
+            frame, term_size = new_frame, size
+            sys.stdout.write(out)
+            sys.stdout.flush()
+            # 10 images/s au plus: les mises à jour rapprochées sont regroupées dans l'image suivante
+            self._stop_event.wait(0.1)
 
     def _start_progress(self) -> threading.Thread:
-        self._stop_flag = False
-        t = threading.Thread(target=self._display_progress, daemon=True)
-        t.start()
-        return t
+        self._stop_event.clear()
+        self._progress_thread = threading.Thread(target=self._display_progress, daemon=True)
+        self._progress_thread.start()
+        return self._progress_thread
 
     def _stop_progress(self):
-        self._stop_flag = True
-        time.sleep(0.5)
+        self._stop_event.set()
+        self._progress_event.set()  # Réveille le thread d'affichage immédiatement
+        # Attendre la dernière image avant d'afficher le résumé
+        if self._progress_thread is not None:
+            self._progress_thread.join(timeout=1.0)
         print()
 
     def _update_progress(self, track=None, prog=None, status=None):
@@ -98,98 +206,156 @@ class SpotifyDownloader:
             if track is not None: self.progress.current_track = track
             if prog is not None: self.progress.current_track_progress = prog
             if status is not None: self.progress.current_track_status = status
+        self._progress_event.set()
 
     def _extract_spotify_info(self, url: str) -> Tuple[str,str]:
-        if 'spotify.com' not in url:
+        # URL sans schéma ("open.spotify.com/album/..."): urlparse n'y verrait pas de domaine
+        parsed = urlparse(url if '://' in url else f'https://{url}')
+        if not parsed.netloc.endswith('spotify.com'):
             raise ValueError('URL Spotify invalide')
-        pattern = r'spotify\.com/([^/]+)/([^/?]+)'
-        m = re.search(pattern, url)
-        if not m: raise ValueError("Impossible d'extraire info URL")
-        t,id_ = m.groups()
-        if t not in ['album','playlist']: raise ValueError('Le type doit être album ou playlist')
+        parts = parsed.path.strip('/').split('/')
+        if len(parts) < 2 or not parts[1]: raise ValueError("Impossible d'extraire info URL")
+        t,id_ = parts[0], parts[1]
+        if t not in ('album','playlist'): raise ValueError('Le type doit être album ou playlist')
         return t,id_
 
-    def _get_playlist_info(self, playlist_id: str) -> List[Tuple[str,str,str,str]]:
-        plist = self.sp.playlist(playlist_id)
-        total = plist['tracks']['total']
-        items=[]; offset=0
-        while offset < total:
-            batch = self.sp.playlist_tracks(playlist_id, offset=offset, limit=100,
-                                            fields='items(track(id,name,artists,album)),total')
+    def _fetch_pages(self, fetch: Callable[[int], dict], first: dict, page_size: int) -> List[dict]:
+        """Récupère en parallèle les pages restantes d'une pagination Spotify, dans l'ordre des offsets"""
+        pages = [first] + list(self._page_pool.map(fetch, range(page_size, first['total'], page_size)))
+        # Le total peut avoir changé pendant la pagination: suivre 'next' jusqu'au bout
+        while pages[-1].get('next'):
+            pages.append(self.sp.next(pages[-1]))
+        return pages
+
+    def _cached(self, key: str, compute: Callable[[], List[TrackItem]]) -> List[TrackItem]:
+        """Résultat mis en cache sur disque (JSON) sous .cache/, calculé une seule fois par clé"""
+        digest = hashlib.sha1(f'{_CACHE_VERSION}:{key}'.encode('utf-8')).hexdigest()
+        with self._lock:
+            key_lock = self._cache_locks.setdefault(digest, threading.Lock())
+        path = self.cache_dir / f'{digest}.json'
+        with key_lock:
+            try:
+                return [tuple(item) for item in json.loads(path.read_text(encoding='utf-8'))]
+            except (OSError, ValueError):
+                pass
+            items = compute()
+            # Écriture atomique: un autre processus ne lit jamais un fichier à moitié écrit
+            tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+            tmp.write_text(json.dumps(items), encoding='utf-8')
+            os.replace(tmp, path)
+            return items
+
+    def _get_playlist_info(self, playlist_id: str) -> List[TrackItem]:
+        # Le snapshot_id change à chaque modification de la playlist
+        snapshot = self.sp.playlist(playlist_id, fields='snapshot_id')['snapshot_id']
+        return self._cached(f'playlist:{playlist_id}:{snapshot}', lambda: self._fetch_playlist_info(playlist_id))
+
+    def _fetch_playlist_info(self, playlist_id: str) -> List[TrackItem]:
+        fields = 'items(track(id,name,artists(name),album(name),external_urls)),total,next'
+        def fetch(offset: int) -> dict:
+            return self.sp.playlist_items(playlist_id, offset=offset, limit=100,
+                                          fields=fields, additional_types=('track',))
+        items=[]; seen=set()
+        for batch in self._fetch_pages(fetch, fetch(0), 100):
             for it in batch['items']:
                 tr = it['track']
-                if not tr or not tr.get('id'): continue
+                # Pistes en double dans la playlist écartées avant tout traitement
+                if not tr or not tr.get('id') or tr['id'] in seen: continue
+                seen.add(tr['id'])
                 artist = sanitize_filename(tr['artists'][0]['name'])
                 album = sanitize_filename(tr['album']['name'])
-                items.append((artist,album,tr['id'],'playlist'))
-            offset += 100
-            time.sleep(0.1)
+                items.append((artist,album,tr['id'],'playlist',self._track_url(tr),sanitize_filename(tr['name'])))
         return items
 
-    def _get_album_info(self, album_id: str) -> List[Tuple[str,str,str,str]]:
+    def _get_album_info(self, album_id: str) -> List[TrackItem]:
+        return self._cached(f'album:{album_id}', lambda: self._fetch_album_info(album_id))
+
+    def _fetch_album_info(self, album_id: str) -> List[TrackItem]:
         album = self.sp.album(album_id)
         artist = sanitize_filename(album['artists'][0]['name'])
         name = sanitize_filename(album['name'])
-        total = album['tracks']['total']
-        items=[]; offset=0
-        while offset < total:
-            batch = self.sp.album_tracks(album_id, offset=offset, limit=50)
+        def fetch(offset: int) -> dict:
+            return self.sp.album_tracks(album_id, offset=offset, limit=50)
+        # La réponse de sp.album contient déjà la première page de pistes
+        items=[]
+        for batch in self._fetch_pages(fetch, album['tracks'], 50):
             for tr in batch['items']:
                 if not tr.get('id'): continue
-                items.append((artist,name,tr['id'],'album'))
-            offset += 50
-            time.sleep(0.1)
+                items.append((artist,name,tr['id'],'album',self._track_url(tr),sanitize_filename(tr['name'])))
         return items
 
-    def parse_spotify_item(self, url: str) -> List[Tuple[str,str,str,str]]:
+    @staticmethod
+    def _track_url(track: dict) -> str:
+        """URL de la piste telle que renvoyée par l'API, reconstruite seulement si absente"""
+        return track.get('external_urls', {}).get('spotify') or f"https://open.spotify.com/track/{track['id']}"
+
+    def parse_spotify_item(self, url: str) -> List[TrackItem]:
         t,id_ = self._extract_spotify_info(url)
         return self._get_album_info(id_) if t=='album' else self._get_playlist_info(id_)
 
-    def _file_exists(self, artist: str, album: str, track_id: str) -> bool:
+    def _file_exists(self, artist: str, album: str, title: str) -> bool:
         """
         Vérifie si un fichier de musique existe déjà.
         Recherche dans le dossier artist/album/ plusieurs formats possibles.
         """
         try:
-            # Obtenir le titre de la piste
-            track_info = self.sp.track(track_id)
-            title = sanitize_filename(track_info['name'])
-            
-            # Chemins à vérifier
-            artist_dir = self.music_directory / artist
-            album_dir = artist_dir / album
-            
-            if not album_dir.exists():
+            # Dossier absent de l'index: rien n'a encore été téléchargé pour cet album
+            album_dir = self.music_directory / artist / album
+            listing = self._album_listing_cache.get(album_dir)
+            if listing is None:
                 return False
             
             # Formats de fichiers possibles
             possible_filenames = [
                 f"{title}.mp3",
-                f"{artist} - {title}.mp3",
-                f"{sanitize_filename(track_info['name'])}.mp3",
-                f"{artist} - {sanitize_filename(track_info['name'])}.mp3"
+                f"{artist} - {title}.mp3"
             ]
             
-            # Vérifier tous les fichiers MP3 dans le dossier
-            for mp3_file in album_dir.glob("*.mp3"):
-                filename = mp3_file.name
-                # Vérification exacte
-                if filename in possible_filenames:
-                    return True
-                # Vérification approximative (enlever caractères spéciaux)
-                clean_filename = re.sub(r'[^\w\s-]', '', filename.lower())
-                clean_title = re.sub(r'[^\w\s-]', '', title.lower())
-                if clean_title in clean_filename:
-                    return True
-            
-            return False
+            names, clean_stems = listing
+            # Vérification exacte
+            if any(filename in names for filename in possible_filenames):
+                return True
+            # Vérification approximative (enlever caractères spéciaux)
+            return _CLEAN_RE.sub('', title.lower()) in clean_stems
             
         except Exception as e:
             print(f"Erreur lors de la vérification du fichier: {e}")
             return False
 
+    def _index_existing(self):
+        """Liste une seule fois au démarrage les MP3 de Music/<artiste>/<album>/"""
+        with os.scandir(self.music_directory) as artists:
+            for artist in artists:
+                if not artist.is_dir(): continue
+                with os.scandir(artist.path) as albums:
+                    for album in albums:
+                        if album.is_dir():
+                            self._scan_album(self.music_directory / artist.name / album.name)
+
+    def _scan_album(self, album_dir: Path) -> Tuple[Set[str], Set[str]]:
+        """
+        Noms des MP3 du dossier et leurs titres nettoyés, relistés après chaque téléchargement.
+        Pour "<artistes> - <titre>.mp3" (nommage spotdl), le titre seul est aussi indexé.
+        """
+        with os.scandir(album_dir) as it:
+            names = {entry.name for entry in it if entry.name.endswith('.mp3')}
+        clean_stems = set()
+        for name in names:
+            stem = name[:-len('.mp3')]
+            clean_stems.add(_CLEAN_RE.sub('', stem.lower()))
+            if ' - ' in stem:
+                clean_stems.add(_CLEAN_RE.sub('', stem.split(' - ', 1)[1].lower()))
+        listing = (names, clean_stems)
+        self._album_listing_cache[album_dir] = listing
+        return listing
+
+    def _count_mp3(self, artist: str, album: str) -> int:
+        """Nombre de fichiers MP3 déjà présents dans le dossier artist/album/"""
+        listing = self._album_listing_cache.get(self.music_directory / artist / album)
+        return len(listing[0]) if listing else 0
+
     def _read_output(self, pipe, output_queue):
-        """Thread pour lire la sortie du processus en temps réel"""
+        """Thread pour lire la sortie du processus en temps réel (None marque la fin)"""
         try:
             while True:
                 line = pipe.readline()
@@ -200,11 +366,80 @@ class SpotifyDownloader:
             pass
         finally:
             pipe.close()
+            output_queue.put(None)
 
-    def _download_spotdl(self, url: str, cwd: Path, display: str) -> bool:
-        """Télécharge une piste avec spotdl et affiche la progression en temps réel"""
-        cmd = ['spotdl', 'download', url, '--format', 'mp3', '--bitrate', '320k', '--overwrite', 'skip']
+    def _iter_output(self, proc: subprocess.Popen) -> Iterator[Optional[str]]:
+        """
+        Lignes de sortie du processus au fil de l'eau, jusqu'à la fin du flux.
+        Produit None quand aucune ligne n'arrive pendant 0.5s.
+        Sous POSIX la lecture est non bloquante via selectors; Windows ne sait pas
+        faire select() sur un pipe, on y garde un thread lecteur.
+        """
+        if os.name == 'nt':
+            output_queue = queue.Queue()
+            threading.Thread(target=self._read_output, args=(proc.stdout, output_queue), daemon=True).start()
+            while True:
+                try:
+                    line = output_queue.get(timeout=0.5)
+                except queue.Empty:
+                    yield None
+                    continue
+                if line is None:
+                    return
+                yield line
+
+        fd = proc.stdout.fileno()
+        os.set_blocking(fd, False)
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        pending = ''
+        with selectors.DefaultSelector() as sel:
+            sel.register(fd, selectors.EVENT_READ)
+            while True:
+                if not sel.select(timeout=0.5):
+                    yield None
+                    continue
+                try:
+                    chunk = os.read(fd, 4096)
+                except BlockingIOError:
+                    continue
+                if not chunk:
+                    pending += decoder.decode(b'', final=True)
+                    if pending.strip():
+                        yield pending.strip()
+                    return
+                # Même découpage que readline() en mode texte (\r, \n et \r\n)
+                pending += decoder.decode(chunk)
+                *lines, pending = pending.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+                for line in lines:
+                    yield line.strip()
+
+    def _download_spotdl(self, tracks: List[Tuple[str,str]], cwd: Path, display: str, done: Set[int]) -> bool:
+        """
+        Télécharge un lot de pistes (url, titre) en un seul appel spotdl et affiche la progression en temps réel.
+        Les indices des pistes dont spotdl annonce la fin sont ajoutés à `done` au fil de l'eau.
+        """
+        cmd = ['spotdl', 'download', *(url for url, _ in tracks),
+               '--format', 'mp3', '--bitrate', '320k', '--overwrite', 'skip', '--threads', '4']
         self._update_progress(track=display, prog=0, status='🔄 Démarrage')
+        # Titres déjà passés par sanitize_filename: le nom annoncé par spotdl y passe aussi avant comparaison
+        titles = [_CLEAN_RE.sub('', title.lower()) for _, title in tracks]
+
+        def mark_done(line: str):
+            m = _DONE_RE.search(line)
+            if not m:
+                return
+            name = _CLEAN_RE.sub('', sanitize_filename(m.group('quoted') or m.group('name')).lower())
+            # Titre exact, précédé ou non des artistes; le plus long l'emporte ("Intro" / "Intro (Live)")
+            matches = [n for n, title in enumerate(titles)
+                       if title and (name == title or name.endswith(f' - {title}'))]
+            if not matches:
+                return
+            n = max(matches, key=lambda n: len(titles[n]))
+            if n not in done:
+                done.add(n)
+                with self._lock:
+                    self.progress.completed_items += 1
+                self._progress_event.set()
         
         try:
             # Démarrer le processus
@@ -213,86 +448,59 @@ class SpotifyDownloader:
                 cwd=cwd, 
                 stdout=subprocess.PIPE, 
                 stderr=subprocess.STDOUT,  # Rediriger stderr vers stdout
-                text=True, 
-                bufsize=1,
-                universal_newlines=True
+                encoding='utf-8',
+                errors='replace',  # spotdl émet de l'UTF-8 (emojis), indépendamment de la locale
+                bufsize=-1
             )
             
-            # Queue pour recevoir les lignes de sortie
-            output_queue = queue.Queue()
-            
-            # Thread pour lire la sortie
-            reader_thread = threading.Thread(
-                target=self._read_output, 
-                args=(proc.stdout, output_queue),
-                daemon=True
-            )
-            reader_thread.start()
-            
             last_progress = 0
-            progress_patterns = [
-                r'(\d+(?:\.\d+)?)%',  # Format standard: 45.2%
-                r'(\d+)/\d+\s*\((\d+(?:\.\d+)?)%\)',  # Format avec ratio: 45/100 (45%)
-                r'Downloaded\s+(\d+(?:\.\d+)?)%',  # Format avec "Downloaded"
-                r'Progress:\s*(\d+(?:\.\d+)?)%',  # Format avec "Progress:"
-            ]
+            output_lines = deque(maxlen=16)  # Seules les dernières lignes servent au contexte d'erreur
+            upd = self._update_progress
             
             # Simulation de progression basée sur le temps (fallback)
             start_time = time.time()
-            estimated_duration = 30  # Estimation de 30 secondes par défaut
+            estimated_duration = 30 * len(tracks)  # Estimation de 30 secondes par piste par défaut
             
-            while proc.poll() is None:
-                try:
-                    # Essayer de lire une ligne avec timeout
-                    line = output_queue.get(timeout=0.5)
-                    
-                    # Chercher un pourcentage dans la ligne
-                    progress_found = False
-                    for pattern in progress_patterns:
-                        match = re.search(pattern, line)
-                        if match:
-                            try:
-                                # Prendre le premier groupe qui contient un pourcentage
-                                if len(match.groups()) > 1:
-                                    progress = float(match.group(2))  # Deuxième groupe pour les formats avec ratio
-                                else:
-                                    progress = float(match.group(1))  # Premier groupe pour les autres
-                                
-                                if 0 <= progress <= 100:
-                                    last_progress = progress
-                                    self._update_progress(prog=progress, status='📥 Téléchargement')
-                                    progress_found = True
-                                    break
-                            except (ValueError, IndexError):
-                                continue
-                    
-                    # Analyser d'autres indicateurs de statut
-                    if not progress_found:
-                        line_lower = line.lower()
-                        if any(word in line_lower for word in ['downloading', 'téléchargement', 'download']):
-                            self._update_progress(status='📥 Téléchargement')
-                        elif any(word in line_lower for word in ['converting', 'conversion']):
-                            self._update_progress(status='🔄 Conversion')
-                        elif any(word in line_lower for word in ['searching', 'recherche']):
-                            self._update_progress(status='🔍 Recherche')
-                
-                except queue.Empty:
+            for line in self._iter_output(proc):
+                if line is None:
                     # Pas de nouvelle ligne, utiliser progression estimée
                     elapsed = time.time() - start_time
                     estimated_progress = min(95, (elapsed / estimated_duration) * 100)
                     if estimated_progress > last_progress:
                         last_progress = estimated_progress
-                        self._update_progress(prog=last_progress, status='📥 Téléchargement')
+                        upd(prog=last_progress, status='📥 Téléchargement')
+                    continue
+
+                output_lines.append(line)
+                mark_done(line)
                 
-                time.sleep(0.1)
-            
+                # Chercher un pourcentage dans la ligne (tous les formats contiennent '%')
+                progress_found = False
+                match = _PROGRESS_RE.search(line) if '%' in line else None
+                if match:
+                    # Un seul groupe nommé par format: celui qui a correspondu
+                    progress = float(match.group(match.lastgroup))
+                    if 0 <= progress <= 100:
+                        last_progress = progress
+                        upd(prog=progress, status='📥 Téléchargement')
+                        progress_found = True
+                
+                # Analyser d'autres indicateurs de statut
+                if not progress_found:
+                    m = _STATUS_RE.search(line)
+                    if m:
+                        upd(status=_STATUS_TABLE[m.group().lower()])
+        
             # Attendre la fin du processus
             rc = proc.wait()
             
             # Marquer comme terminé
             success = rc == 0
             final_progress = 100 if success else last_progress
-            status = '✅ Succès' if success else '❌ Échec'
+            status = '✅ Succès'
+            if not success:
+                last_line = next((l for l in reversed(output_lines) if l), '')
+                status = f'❌ Échec: {last_line[:40]}' if last_line else '❌ Échec'
             
             self._update_progress(prog=final_progress, status=status)
             return success
@@ -301,79 +509,171 @@ class SpotifyDownloader:
             self._update_progress(prog=0, status=f'❌ Erreur: {str(e)[:20]}')
             return False
 
-    def download_item(self, artist: str, album: str, track_id: str, url_type: str) -> bool:
-        artist_dir = self.music_directory / artist
-        artist_dir.mkdir(exist_ok=True)
-        album_dir = artist_dir / album
-        album_dir.mkdir(exist_ok=True)
+    def _ensure_dir(self, path: Path):
+        """Crée le dossier une seule fois par exécution"""
+        # Dossiers déjà vus par l'index de démarrage: aucun appel système
+        if path not in self._created_dirs and path not in self._album_listing_cache:
+            if not os.path.isdir(path):
+                os.makedirs(path, exist_ok=True)
+            self._created_dirs.add(path)
 
-        # Vérifier si le fichier existe déjà
-        if self._file_exists(artist, album, track_id):
-            try:
-                track_info = self.sp.track(track_id)
-                title = sanitize_filename(track_info['name'])
+    def _known_ids(self, album_dir: Path) -> Set[str]:
+        """IDs des pistes déjà téléchargées dans ce dossier (fichier _TRACK_IDS_FILE, lu une fois)"""
+        with self._ids_lock:
+            ids = self._downloaded_ids.get(album_dir)
+            if ids is None:
+                try:
+                    ids = set((album_dir / _TRACK_IDS_FILE).read_text(encoding='utf-8').split())
+                except OSError:
+                    ids = set()
+                self._downloaded_ids[album_dir] = ids
+            return ids
+
+    def _record_ids(self, album_dir: Path, track_ids: List[str]):
+        """Ajoute des IDs de pistes téléchargées au fichier _TRACK_IDS_FILE du dossier"""
+        if not track_ids:
+            return
+        known = self._known_ids(album_dir)
+        data = ''.join(f'{i}\n' for i in track_ids)
+        # Verrou dédié: l'écriture disque ne bloque pas les mises à jour de progression
+        with self._ids_lock:
+            known.update(track_ids)
+            with open(album_dir / _TRACK_IDS_FILE, 'a', encoding='utf-8') as f:
+                f.write(data)
+
+    def download_item(self, artist: str, album: str, album_dir: Path, tracks: List[TrackItem]) -> bool:
+        """Télécharge les pistes d'un même dossier artist/album/ (déjà créé), par lots d'un seul appel spotdl"""
+        known = self._known_ids(album_dir)
+        pending: List[Tuple[str,str]] = []
+        pending_ids: List[str] = []
+        for _, _, track_id, _, url, title in tracks:
+            # Déjà téléchargée lors d'une exécution précédente: aucun appel réseau
+            if track_id in known:
+                with self._lock:
+                    self.progress.completed_items += 1
+                    self.progress.skipped_items += 1
+                self._progress_event.set()
+                continue
+
+            # Vérifier si le fichier existe déjà
+            if self._file_exists(artist, album, title):
+                self._record_ids(album_dir, [track_id])
                 self._update_progress(track=f'{artist} - {title}', prog=100, status='⏭️ Déjà téléchargé')
-                time.sleep(0.3)  # Délai pour voir le message
                 with self._lock:
                     self.progress.completed_items += 1
                     self.progress.skipped_items += 1
-                return True
-            except Exception as e:
-                print(f'Erreur lors de la récupération des infos de la piste: {e}')
+                self._progress_event.set()
+                continue
 
-        # Get track title pour le téléchargement
-        try:
-            title_raw = self.sp.track(track_id)['name']
-        except:
-            title_raw = track_id
-        title = sanitize_filename(title_raw)
+            pending.append((url, title))
+            pending_ids.append(track_id)
 
         # Download
-        url = f'https://open.spotify.com/track/{track_id}'
-        ok = self._download_spotdl(url, album_dir, f'{artist} - {title}')
-        
-        with self._lock:
-            self.progress.completed_items += 1
-            if not ok: 
-                self.progress.failed_items.append(f'{artist} - {title}')
-        
-        time.sleep(0.5)  # Pause pour voir le résultat final
+        ok = True
+        for start in range(0, len(pending), _SPOTDL_BATCH_SIZE):
+            batch = pending[start:start + _SPOTDL_BATCH_SIZE]
+            batch_ids = pending_ids[start:start + _SPOTDL_BATCH_SIZE]
+            done: Set[int] = set()
+            batch_ok = self._download_spotdl(batch, album_dir, f'{artist} - {album}', done)
+            # De nouveaux fichiers sont apparus: mettre l'index à jour pour ce dossier
+            self._scan_album(album_dir)
+            # Seules les pistes dont le fichier est bien présent sont mémorisées (spotdl renvoie 0
+            # même si une recherche échoue)
+            present = {n for n, (_, title) in enumerate(batch) if self._file_exists(artist, album, title)}
+            self._record_ids(album_dir, [batch_ids[n] for n in sorted(present)])
+
+            # Pistes non annoncées par spotdl: comptées à la fin du lot, en échec si aucun fichier
+            remaining = [n for n in range(len(batch)) if n not in done]
+            failed = [f'{artist} - {batch[n][1]}' for n in remaining if n not in present]
+            with self._lock:
+                self.progress.completed_items += len(remaining)
+                self.progress.failed_items.extend(failed)
+            self._progress_event.set()
+            ok = ok and batch_ok and not failed
         return ok
 
+    def _parse_urls(self, urls: List[str], out: queue.Queue):
+        """Producteur: analyse les URLs et publie chaque lot de pistes dès qu'il est prêt"""
+        try:
+            with ThreadPoolExecutor(max_workers=8) as ex:
+                for parsed in ex.map(self.parse_spotify_item, urls):
+                    out.put(parsed)
+        except Exception as e:
+            out.put(e)
+        finally:
+            out.put(None)
+
+    def _skip_complete_albums(self, items: List[TrackItem], parsed: List[TrackItem]) -> List[TrackItem]:
+        """
+        Retire les pistes des albums déjà complets sur le disque (inutile de lancer spotdl).
+        Le nombre attendu vient de `parsed`, l'album entier avant dédoublonnage: les pistes déjà
+        vues dans une URL précédente ne doivent pas réduire ce nombre.
+        """
+        expected = Counter((a,alb) for a,alb,_,t,*_ in parsed if t=='album')
+        complete = {k for k,n in expected.items() if self._count_mp3(*k) >= n}
+        if not complete:
+            return items
+        pending = [it for it in items if not (it[3]=='album' and (it[0],it[1]) in complete)]
+        skipped = len(items) - len(pending)
+        with self._lock:
+            self.progress.completed_items += skipped
+            self.progress.skipped_items += skipped
+        return pending
+
     def process_urls_file(self, filepath: Optional[str]=None):
         path = Path(filepath) if filepath else self.script_directory/'urls.txt'
         if not path.exists(): 
             print(f'❌ {path} introuvable')
             return
             
-        urls = [l.strip() for l in path.read_text(encoding='utf-8').splitlines() if l.strip()]
-        all_items=[]
+        # dict.fromkeys supprime les URLs répétées en conservant l'ordre
+        urls = list(dict.fromkeys(u for l in path.read_text(encoding='utf-8').splitlines() if (u := l.strip())))
         
         print("🔍 Analyse des URLs...")
-        for u in urls:
-            print(f'   Analyse: {u}')
-            all_items += self.parse_spotify_item(u)
-            
-        # Remove duplicates
-        seen=set(); items=[]
-        for a,alb,i,t in all_items:
-            if (a,alb,i) not in seen:
-                seen.add((a,alb,i)); items.append((a,alb,i,t))
-                
-        print(f"📊 {len(items)} pistes uniques trouvées")
-        
-        self.progress.total_items = len(items)
-        thread = self._start_progress()
+        # Les téléchargements démarrent dès la première URL analysée;
+        # la queue bornée freine l'analyse si les téléchargements prennent du retard
+        parsed_queue: queue.Queue = queue.Queue(maxsize=256)
+        # Groupes soumis mais pas encore terminés: au-delà, le consommateur attend et la queue se remplit
+        slots = threading.BoundedSemaphore(self.max_parallel_downloads * 2)
+        threading.Thread(target=self._parse_urls, args=(urls, parsed_queue), daemon=True).start()
+
+        self._start_progress()
         
         try:
-            for a,alb,i,t in items:
-                self.download_item(a,alb,i,t)
+            with ThreadPoolExecutor(max_workers=self.max_parallel_downloads) as ex:
+                futures = []
+                seen = set()
+                while (parsed := parsed_queue.get()) is not None:
+                    if isinstance(parsed, Exception):
+                        raise parsed
+                    # Remove duplicates (l'ID Spotify suffit, l'ordre d'apparition est conservé);
+                    # chaque lot est déjà sans doublon, seuls les lots précédents sont à vérifier
+                    items = [item for item in parsed if item[2] not in seen]
+                    seen.update(item[2] for item in items)
+                    with self._lock:
+                        self.progress.total_items += len(items)
+                    self._progress_event.set()
+                    # Un seul appel spotdl par dossier artist/album/
+                    groups: Dict[Tuple[str,str], List[TrackItem]] = {}
+                    for item in self._skip_complete_albums(items, parsed):
+                        groups.setdefault((item[0], item[1]), []).append(item)
+                    for (a, alb), tracks in groups.items():
+                        # Dossiers créés ici, une fois par groupe, plutôt que dans les workers
+                        album_dir = self.music_directory / a / alb
+                        self._ensure_dir(album_dir)
+                        slots.acquire()
+                        fut = ex.submit(self.download_item, a, alb, album_dir, tracks)
+                        fut.add_done_callback(lambda _: slots.release())
+                        futures.append(fut)
+                for fut in as_completed(futures):
+                    fut.result()
         finally:
             self._stop_progress()
             
         # Summary
         successful = self.progress.completed_items - len(self.progress.failed_items)
         print(f"\n📈 RÉSUMÉ:")
+        print(f"📊 {self.progress.total_items} pistes uniques trouvées")
         print(f"✅ {successful}/{self.progress.total_items} téléchargements réussis")
         print(f"⏭️ {self.progress.skipped_items} fichiers déjà présents")
         if self.progress.failed_items: